@@ -0,0 +1,258 @@
+"""Cross-channel market analytics over the daily price history.
+
+`MarketAnalytics` keeps every channel's daily prices in one dense
+(channels x days) numpy array, so rolling returns, top movers, momentum
+scores and correlations are whole-array operations instead of per-channel
+(or per-pair) ORM queries. New days are appended as a column with
+`set_day`, and every result is cached against `version`, which only moves
+when the price history changes.
+
+Correlations are Pearson over the trailing `window` daily returns. A single
+channel's row costs one matrix-vector product; full matrices are only built
+for an explicit subset of channels, since 5k x 5k would be ~200MB.
+"""
+import threading
+import warnings
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+class MarketAnalytics:
+    """Price history for all channels plus cached analytics over it."""
+
+    def __init__(self, initial_days: int = 32):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.days: List[int] = []
+        self.day_index: Dict[int, int] = {}
+        self._prices = np.full((0, initial_days), np.nan)
+        self.version = 0
+        self._cache: Dict[tuple, object] = {}
+        self._cache_version = 0
+        self._lock = threading.RLock()
+
+    # -----------------------------
+    # Loading / incremental updates
+    # -----------------------------
+    @property
+    def prices(self) -> np.ndarray:
+        """(channels x days) price matrix; NaN where a channel has no price."""
+        return self._prices[:, : len(self.days)]
+
+    def _ensure_rows(self, names: Iterable[str]):
+        new = [n for n in names if n not in self.index]
+        if not new:
+            return
+        for n in new:
+            self.index[n] = len(self.names)
+            self.names.append(n)
+        extra = np.full((len(new), self._prices.shape[1]), np.nan)
+        self._prices = np.vstack([self._prices, extra])
+
+    def _ensure_column(self, day: int) -> int:
+        col = self.day_index.get(day)
+        if col is not None:
+            return col
+        if self.days and day < self.days[-1]:
+            # out-of-order day: insert it in place and renumber the columns after it
+            pos = int(np.searchsorted(self.days, day))
+            self._prices = np.insert(self._prices, pos, np.nan, axis=1)
+            self.days.insert(pos, day)
+            self.day_index = {d: i for i, d in enumerate(self.days)}
+            return pos
+        if len(self.days) == self._prices.shape[1]:
+            # grow geometrically so appending a day is amortized O(channels)
+            grown = np.full(
+                (self._prices.shape[0], max(1, self._prices.shape[1] * 2)), np.nan
+            )
+            grown[:, : self._prices.shape[1]] = self._prices
+            self._prices = grown
+        self.days.append(day)
+        self.day_index[day] = len(self.days) - 1
+        return len(self.days) - 1
+
+    def set_day(self, day: int, prices: Dict[str, float]):
+        """Record one day's prices (a new day, or overwriting an existing one)."""
+        with self._lock:
+            self._ensure_rows(prices)
+            col = self._ensure_column(day)
+            rows = np.fromiter((self.index[n] for n in prices), dtype=np.intp)
+            self._prices[rows, col] = np.fromiter(prices.values(), dtype=float)
+            self.version += 1
+
+    def load(self, rows: Iterable[tuple]):
+        """Bulk load (channel_name, day, price) rows; later rows win on duplicates."""
+        by_day: Dict[int, Dict[str, float]] = {}
+        for name, day, price in rows:
+            by_day.setdefault(day, {})[name] = price
+        with self._lock:
+            for day in sorted(by_day):
+                self.set_day(day, by_day[day])
+
+    # -----------------------------
+    # Analytics
+    # -----------------------------
+    def _cached(self, key: tuple, compute):
+        with self._lock:
+            if self._cache_version != self.version:
+                self._cache.clear()
+                self._cache_version = self.version
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    def returns(self) -> np.ndarray:
+        """Daily simple returns, (channels x days-1); NaN where undefined."""
+
+        def compute():
+            p = self.prices
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = p[:, 1:] / p[:, :-1] - 1.0
+            # a move off a zero price is not a meaningful (or JSON-safe) return
+            r[~np.isfinite(r)] = np.nan
+            return r
+
+        return self._cached(("returns",), compute)
+
+    def rolling_returns(self, window: int = 7) -> np.ndarray:
+        """Return over the last `window` days for each channel.
+
+        NaN if the history is too short or the return is not finite.
+        """
+
+        def compute():
+            p = self.prices
+            if p.shape[1] <= window:
+                return np.full(p.shape[0], np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = p[:, -1] / p[:, -1 - window] - 1.0
+            r[~np.isfinite(r)] = np.nan
+            return r
+
+        return self._cached(("rolling", window), compute)
+
+    def top_movers(self, window: int = 7, k: int = 10) -> Dict[str, List[Dict]]:
+        """Top `k` gainers and losers by `window`-day return.
+
+        Gainers are drawn only from positive returns and losers only from
+        negative ones, so a channel never shows up in both lists.
+        """
+
+        def largest(idx: np.ndarray, vals: np.ndarray) -> np.ndarray:
+            # argpartition keeps this O(channels) before sorting just the top k
+            n = min(k, idx.size)
+            if n == 0:
+                return idx[:0]
+            pos = np.argpartition(-vals, n - 1)[:n]
+            return idx[pos[np.argsort(-vals[pos])]]
+
+        def compute():
+            r = self.rolling_returns(window)
+            up = np.flatnonzero(r > 0)
+            down = np.flatnonzero(r < 0)
+            top = largest(up, r[up])
+            bottom = largest(down, -r[down])
+            return {
+                "gainers": [self._row(i, r[i]) for i in top],
+                "losers": [self._row(i, r[i]) for i in bottom],
+            }
+
+        return self._cached(("movers", window, k), compute)
+
+    def momentum(self, window: int = 14) -> np.ndarray:
+        """Risk-adjusted momentum: mean / std of the last `window` daily returns.
+
+        Channels with no variation (or not enough history) score 0.
+        """
+
+        def compute():
+            r = self.returns()[:, -window:]
+            if r.shape[1] < 2:
+                return np.zeros(r.shape[0])
+            with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+                # all-NaN rows (channels with no history) warn; they score 0 below
+                warnings.simplefilter("ignore", RuntimeWarning)
+                score = np.nanmean(r, axis=1) / np.nanstd(r, axis=1)
+            return np.nan_to_num(score, nan=0.0, posinf=0.0, neginf=0.0)
+
+        return self._cached(("momentum", window), compute)
+
+    def trending(self, window: int = 14, k: int = 10) -> List[Dict]:
+        """The `k` channels with the highest momentum score.
+
+        Channels with fewer than two returns in the window have no score and
+        are left out rather than ranked at 0.
+        """
+
+        def compute():
+            score = self.momentum(window)
+            counted = np.isfinite(self.returns()[:, -window:]).sum(axis=1)
+            idx = np.flatnonzero(counted >= 2)
+            n = min(k, idx.size)
+            if n == 0:
+                return []
+            vals = score[idx]
+            top = idx[np.argpartition(-vals, n - 1)[:n]]
+            top = top[np.argsort(-score[top])]
+            return [self._row(i, score[i], key="score") for i in top]
+
+        return self._cached(("trending", window, k), compute)
+
+    def _standardized(self, window: int) -> np.ndarray:
+        """Trailing returns z-scored per channel, scaled so Z @ Z.T is Pearson r."""
+
+        def compute():
+            r = self.returns()[:, -window:]
+            if r.shape[1] < 2:
+                return np.zeros_like(r)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                r = r - np.nanmean(r, axis=1, keepdims=True)
+            # missing returns contribute nothing once centred
+            r = np.nan_to_num(r, nan=0.0, posinf=0.0, neginf=0.0)
+            norm = np.linalg.norm(r, axis=1, keepdims=True)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = np.where(norm > 0, r / norm, 0.0)
+            return z
+
+        return self._cached(("zscores", window), compute)
+
+    def correlation_matrix(
+        self, channels: List[str], window: int = 30
+    ) -> Dict[str, object]:
+        """Pairwise correlation matrix for the named channels (unknown names skipped)."""
+        names = [c for c in channels if c in self.index]
+
+        def compute():
+            z = self._standardized(window)[[self.index[n] for n in names]]
+            return {"channels": names, "matrix": np.round(z @ z.T, 6).tolist()}
+
+        return self._cached(("corr", window, tuple(names)), compute)
+
+    def most_correlated(self, channel: str, window: int = 30, k: int = 10) -> List[Dict]:
+        """The `k` channels whose returns correlate most strongly with `channel`."""
+        if channel not in self.index:
+            return []
+
+        def compute():
+            z = self._standardized(window)
+            i = self.index[channel]
+            corr = z @ z[i]
+            corr[i] = -np.inf
+            n = min(k, corr.size - 1)
+            if n <= 0:
+                return []
+            top = np.argpartition(-corr, n - 1)[:n]
+            top = top[np.argsort(-corr[top])]
+            return [self._row(j, corr[j], key="correlation") for j in top]
+
+        return self._cached(("most_corr", channel, window, k), compute)
+
+    def _row(self, i: int, value: float, key: str = "return") -> Dict:
+        return {
+            "channel": self.names[i],
+            key: round(float(value), 6),
+            "price": float(self.prices[i, -1]) if self.days else None,
+        }
+
@@ -1,7 +1,7 @@
 from flask import Flask, jsonify
 import os
 import sys
-import pandas as pd
+import threading
 import google.generativeai as genai
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
@@ -11,10 +11,22 @@ from typing import Dict, List, Tuple
 import math
 import random
 import statistics
+import time
 
 # import google_auth_oauthlib.flow
-import googleapiclient.discovery
-import googleapiclient.errors
+
+from analytics import MarketAnalytics
+from handles import (
+    HANDLES_FILE,
+    HandleLoader,
+    load_handles,
+    normalize_handle,
+    plan_universe_update,
+)
+from jobs import JobQueue, start_workers
+from snapshot import SnapshotReader
+from sources import MetricRecord, YouTubeAdapter, ingest
+from valuation import PortfolioBook
 
 # Instanstiaze flask app
 app = Flask(__name__)
@@ -70,6 +82,28 @@ class ChannelStats(db.Model):
     youtuber = db.relationship("Youtuber", back_populates="stats")
 
 
+class ChannelMetric(db.Model):
+    """
+    Latest normalized metrics for an entity on any platform (see sources.py)
+    """
+
+    __tablename__ = "channel_metrics"
+    __table_args__ = (
+        db.UniqueConstraint("platform", "handle"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    platform = db.Column(db.String(32), nullable=False)
+    handle = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    followers = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    engagement = db.Column(db.Float, nullable=False, default=0.0)
+    price = db.Column(db.Float, nullable=False, default=0.0)
+    fetched_at = db.Column(db.Float)
+
+
 class UserBehavior(db.Model):
     """
     Model for user activity points (how much profit, trades, etc.)
@@ -88,6 +122,34 @@ class UserBehavior(db.Model):
     running_net = db.Column(db.Integer)
 
 
+class StatsRetirement(db.Model):
+    """
+    One row per refresh that retired channels (deleting their ChannelStats),
+    so caches built from the stats history know to rebuild rather than append
+    """
+
+    __tablename__ = "stats_retirements"
+    __table_args__ = {"extend_existing": True}
+    id = db.Column(db.Integer, primary_key=True)
+    channels = db.Column(db.Integer, nullable=False)
+    retired_at = db.Column(db.Float, nullable=False)
+
+
+class PortfolioTrade(db.Model):
+    """
+    Executed portfolio trades; `portfolio_book` is rebuilt from these on startup
+    """
+
+    __tablename__ = "portfolio_trades"
+    __table_args__ = {"extend_existing": True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(100), nullable=False, index=True)
+    channel = db.Column(db.String(100), nullable=False)
+    shares = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    executed_at = db.Column(db.Float, nullable=False)
+
+
 # -------------------------
 # Create tables (if not exist)
 # -------------------------
@@ -95,6 +157,29 @@ with app.app_context():
     db.create_all()
     print("Database file created at:", os.path.abspath("db.sqlite3"))
 
+# Background jobs for routes that do minutes of API calls / DB writes (see jobs.py)
+os.makedirs(app.instance_path, exist_ok=True)
+job_queue = JobQueue(os.path.join(app.instance_path, "jobs.sqlite3"))
+
+# Per-user holdings, marked to market as prices tick in (see valuation.py). It
+# is a cache: trades are stored in PortfolioTrade and prices come from
+# ChannelStats, both loaded by sync_portfolio_book
+portfolio_book = PortfolioBook()
+_portfolio_lock = threading.Lock()
+# (max ChannelStats.id, max StatsRetirement.id) applied to portfolio_book
+_portfolio_synced = None
+
+# Under `python serve.py` workers read channels and prices from a shared
+# snapshot published by the writer process instead of the DB (see snapshot.py)
+MARKET_SNAPSHOT = os.getenv("MARKET_SNAPSHOT")
+market_reader = SnapshotReader(MARKET_SNAPSHOT) if MARKET_SNAPSHOT else None
+
+# Price history as a dense array for cross-channel analytics (see analytics.py);
+# kept in step with ChannelStats by get_market_analytics, whichever process wrote it
+market_analytics = MarketAnalytics()
+_market_analytics_synced = (0, 0)  # (max ChannelStats.id, max StatsRetirement.id)
+_market_analytics_lock = threading.Lock()
+
 
 # with app.app_context():
 #     db.drop_all()  # deletes all tables
@@ -158,78 +243,269 @@ def grab_context():
 
 @app.route("/grab-yt-data/")
 def grab_yt_data():
-    get_public_channel_info()
-    return "hi"
+    return submit_job("grab-yt-data")
+
+
+@job_queue.task("grab-yt-data")
+def grab_yt_data_job(job):
+    with app.app_context():
+        return refresh_universe(progress=job.progress)
+
+
+def submit_job(name: str, **kwargs):
+    """Queue a background job and answer 202 with where to poll for it."""
+    job_id, created = job_queue.submit(name, **kwargs)
+    return (
+        jsonify({"job_id": job_id, "created": created, "status_url": f"/jobs/{job_id}/"}),
+        202,
+    )
+
+
+@app.route("/jobs/<int:job_id>/")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job)
 
 
 # -----------------------------
 # API REQUEST FUNCTIONS
 # -----------------------------
-def get_public_channel_info():
-    """Retrieve info about a public channel using an API key."""
-    handles = parse_handles()
-    for item in handles:
-        youtube = get_youtube_service_api_key()
-        request = youtube.channels().list(part="snippet, statistics", forHandle=item)
-        response = request.execute()
-
-        if response:
-
-            print(f"{item} Channel Info (API Key):")
-            # print(response)
-
-            channel_items = response["items"]
-            channel = response["items"][0]
-
-            channel_name = channel["snippet"]["title"]
-            channel_pic = channel["snippet"]["thumbnails"]["default"]["url"]
-            stats = channel["statistics"]
-
-            # Print or return
-            print("Channel Name:", channel_name)
-            # print("Channel Pic URL:", channel_pic)
-            # print("Channel info:", response["items"])
-            print("Statistics:", stats)
-
-            new_channel = Youtuber(
-                channel_name=channel_name,
-                channel_handle=channel["snippet"]["customUrl"],
-                profile_pic=channel_pic,
-                view_count=int(stats["viewCount"]),
+def get_public_channel_info(handles: List[str] = None):
+    """Retrieve info about public channels using an API key.
+
+    Defaults to every handle in the handles file.
+    """
+    if handles is None:
+        handles = parse_handles()
+    counts = ingest([(YouTubeAdapter(), handles)], write_metric_records)
+    print("Ingest counts:", counts)
+    return counts
+
+
+def write_metric_records(records: List[MetricRecord]):
+    """Bulk upsert a batch of normalized records and price them.
+
+    Used as the `ingest` sink, so it may run on a worker thread and pushes its
+    own app context. YouTube records are mirrored into `Youtuber` so the
+    existing channel endpoints keep working.
+    """
+    with app.app_context():
+        keys = {r.key for r in records}
+        handles = {handle for _, handle in keys}
+        existing = {
+            (m.platform, m.handle.lower()): m
+            for m in ChannelMetric.query.filter(
+                db.func.lower(ChannelMetric.handle).in_(handles)
             )
+        }
+        for r in records:
+            metric = existing.get(r.key)
+            if metric is None:
+                metric = ChannelMetric(platform=r.platform, handle=r.handle)
+                db.session.add(metric)
+            metric.name = r.name
+            metric.followers = r.followers
+            metric.views = r.views
+            metric.engagement = r.engagement
+            metric.fetched_at = r.fetched_at
+            metric.price = map_stats_to_price_and_vol(r.views) * r.views
+
+        youtube = [r for r in records if r.platform == "youtube"]
+        if youtube:
+            channels = {
+                c.channel_handle.lower(): c
+                for c in Youtuber.query.filter(
+                    db.func.lower(Youtuber.channel_handle).in_(
+                        [r.handle.lower() for r in youtube]
+                    )
+                )
+            }
+            for r in youtube:
+                channel = channels.get(r.handle.lower())
+                if channel is None:
+                    channel = Youtuber(channel_handle=r.handle)
+                    db.session.add(channel)
+                channel.channel_name = r.name
+                channel.profile_pic = r.profile_pic
+                channel.view_count = r.views
 
-            db.session.add(new_channel)
-            db.session.commit()
+        db.session.commit()
 
 
 @app.route("/get-yt-channels-and-views/")
 def get_yt_channels_and_views():
+    body = market_reader.encoded("channels") if market_reader else None
+    if body is not None:
+        return app.response_class(body, mimetype="application/json")
     channels = Youtuber.query.all()
     channel_list = [{"name": c.channel_name, "views": c.view_count} for c in channels]
     return jsonify(channel_list)
 
 
-def get_youtube_service_api_key():
-    """Create a YouTube API service using an API key."""
-    return googleapiclient.discovery.build("youtube", "v3", developerKey=YT_API_KEY)
+def parse_handles():
+    handles = load_handles(HANDLES_FILE)
+    print(f"Loaded {len(handles)} handles")
+    return handles
 
 
-def parse_handles():
+def refresh_universe(progress=None):
+    """Bring the stored channels in line with the handles file.
 
-    # Load CSV into a DataFrame
-    df = pd.read_csv(
-        "../popular_channel_handles.txt",
-        delimiter=",",  # custom delimiter (default is ",")
-        header=0,  # row number to use as column names
-        skiprows=1,  # skip first row(s)
-        names=["channel", "handle", "relation"],  # custom column names
-        usecols=[0, 1],  # read only certain columns
-        na_values=["NA", ""],  # treat these as missing values
+    Does nothing if the file is unchanged since the last refresh and nothing is
+    pending. Otherwise only handles not yet stored are fetched (handles that
+    fail to resolve stay pending and are retried next time), and channels whose
+    handle was dropped from the file are retired (deleted along with their
+    stats and metrics).
+    `progress(fraction, message)` is called between stages if given.
+    """
+    progress = progress or (lambda fraction, message=None: None)
+    loader = HandleLoader(
+        HANDLES_FILE, os.path.join(app.instance_path, "handles_state.json")
+    )
+    loaded = loader.load_if_changed()
+    if loaded is not None:
+        handles, new_state = loaded
+    elif loader.pending_handles:
+        # file unchanged, but some handles failed last time; retry them
+        handles = loader.previous_handles + loader.pending_handles
+        new_state = dict(loader.state)
+    else:
+        print("Handles file unchanged; nothing to refresh.")
+        return {"added": 0, "retired": 0, "pending": 0}
+
+    current = [c.channel_handle for c in Youtuber.query.all()]
+    to_fetch, to_retire = plan_universe_update(
+        handles, loader.previous_handles, current, loader.stored_handles
+    )
+    print(f"Universe refresh: {len(to_fetch)} to fetch, {len(to_retire)} to retire")
+
+    unresolved = set()
+    stored = dict(loader.stored_handles)
+    if to_fetch:
+        progress(0.1, f"fetching {len(to_fetch)} channels")
+        counts = get_public_channel_info(to_fetch)
+        unresolved = {normalize_handle(h) for h in counts["unresolved"]}
+        stored.update(counts["resolved"])
+    if to_retire:
+        progress(0.9, f"retiring {len(to_retire)} channels")
+        for channel in Youtuber.query.filter(Youtuber.channel_handle.in_(to_retire)):
+            db.session.delete(channel)
+        ChannelMetric.query.filter(
+            ChannelMetric.platform == "youtube",
+            db.func.lower(ChannelMetric.handle).in_([h.lower() for h in to_retire]),
+        ).delete(synchronize_session=False)
+        db.session.add(StatsRetirement(channels=len(to_retire), retired_at=time.time()))
+        db.session.commit()
+
+    # only handles that were actually stored count as applied
+    new_state["handles"] = [h for h in handles if normalize_handle(h) not in unresolved]
+    # remember what each handle was stored as, so dropping it retires that channel
+    new_state["stored"] = {
+        h: stored[h] for h in new_state["handles"] if stored.get(h, h) != h
+    }
+    new_state["pending"] = [h for h in handles if normalize_handle(h) in unresolved]
+    loader.commit(new_state)
+    return {
+        "added": len(to_fetch) - len(unresolved),
+        "retired": len(to_retire),
+        "pending": len(new_state["pending"]),
+    }
+
+
+def _portfolio_unavailable():
+    # each serve.py worker would have its own portfolio_book, so trades and reads
+    # would land on different copies; portfolios are single-process only for now
+    return (
+        jsonify({"error": "portfolios are not available in multi-worker mode"}),
+        503,
     )
 
-    handles = df["handle"].tolist()
-    print(handles)
-    return handles
+
+def sync_portfolio_book():
+    """Bring `portfolio_book` up to date with the DB.
+
+    On first use the stored trades are replayed and every channel is marked
+    at its latest price. After that, ChannelStats rows written since the last
+    sync (by this or any other process, e.g. a `python jobs.py` worker) are
+    applied a day at a time and closed on the equity curve. The check is two
+    MAX(id) lookups, so it is cheap enough to run on every request.
+    """
+    global _portfolio_synced
+    with _portfolio_lock:
+        synced = (
+            db.session.query(db.func.max(ChannelStats.id)).scalar() or 0,
+            db.session.query(db.func.max(StatsRetirement.id)).scalar() or 0,
+        )
+        if synced == _portfolio_synced:
+            return
+        if _portfolio_synced is None:
+            for t in PortfolioTrade.query.order_by(PortfolioTrade.id):
+                try:
+                    portfolio_book.apply_trade(t.user_id, t.channel, t.shares, t.price)
+                except ValueError as e:
+                    print(f"Skipping stored trade {t.id}:", e)
+        if _portfolio_synced is None or synced[1] != _portfolio_synced[1]:
+            # first sync, or a retirement deleted rows (SQLite may then reuse
+            # their ids): mark at the latest prices instead of replaying days
+            latest = db.select(db.func.max(ChannelStats.id)).group_by(
+                ChannelStats.youtuber_id
+            )
+            rows = _stats_history_query().filter(ChannelStats.id.in_(latest))
+            portfolio_book.update_prices({name: price for name, _, price in rows})
+        else:
+            by_day: Dict[int, Dict[str, float]] = {}
+            rows = _stats_history_query().filter(ChannelStats.id > _portfolio_synced[0])
+            for name, day, price in rows:
+                by_day.setdefault(day, {})[name] = price
+            for day in sorted(by_day):
+                portfolio_book.update_prices(by_day[day])
+                portfolio_book.close_day(day)
+        _portfolio_synced = synced
+
+
+@app.route("/portfolio/<user_id>/")
+def get_portfolio(user_id):
+    """Cached value, holdings, equity curve and summary for a user."""
+    if MARKET_SNAPSHOT:
+        return _portfolio_unavailable()
+    sync_portfolio_book()
+    return jsonify(portfolio_book.snapshot(user_id))
+
+
+@app.route("/portfolio/<user_id>/trade/", methods=["POST"])
+def portfolio_trade(user_id):
+    """Buy (positive `shares`) or sell (negative) a channel at its current price."""
+    if MARKET_SNAPSHOT:
+        return _portfolio_unavailable()
+    sync_portfolio_book()
+    data = request.get_json() or {}
+    channel = data.get("channel")
+    with _portfolio_lock:
+        price = portfolio_book.prices.get(channel)
+        try:
+            shares = float(data.get("shares", 0))
+            portfolio_book.apply_trade(user_id, channel, shares, price)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        db.session.add(
+            PortfolioTrade(
+                user_id=user_id,
+                channel=channel,
+                shares=shares,
+                price=price,
+                executed_at=time.time(),
+            )
+        )
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # undo it in the book too, so the cache matches what is stored
+            portfolio_book.apply_trade(user_id, channel, -shares, price)
+            raise
+    return jsonify(portfolio_book.snapshot(user_id))
 
 
 @app.route("/calculate-weekly-price/")
@@ -252,26 +528,163 @@ def calculate_weekly_price():
     return channel_new_dict
 
 
+@app.route("/prices/")
+def get_prices():
+    """Latest price per channel, from the shared snapshot when there is one."""
+    body = (
+        market_reader.encoded(
+            "prices", lambda s: {"version": s["version"], "prices": s["prices"]}
+        )
+        if market_reader
+        else None
+    )
+    if body is not None:
+        return app.response_class(body, mimetype="application/json")
+    return jsonify({"version": None, "prices": calculate_weekly_price()})
+
+
+def build_market_snapshot():
+    """Channels and prices in the shape published to serving workers."""
+    channels = Youtuber.query.all()
+    return {
+        "channels": [{"name": c.channel_name, "views": c.view_count} for c in channels],
+        "prices": calculate_weekly_price(),
+    }
+
+
 @app.route("/populate-historical-data/")
 def populate_historical_data():
-    i = 1
+    return submit_job("populate-historical-data")
+
+
+@job_queue.task("populate-historical-data")
+def populate_historical_data_job(job):
+    with app.app_context():
+        return populate_historical_stats(progress=job.progress)
+
+
+def populate_historical_stats(days: int = 7, progress=None):
+    """Write `days` of randomized ChannelStats around each channel's weekly price."""
     historical_data = calculate_weekly_price()
-    for i in range(7):
+    channel_ids = {
+        c.channel_name: c.id
+        for c in Youtuber.query.filter(Youtuber.channel_name.in_(historical_data))
+    }
+    written = 0
+    for i in range(days):
+        day_prices = {}
         for channel in historical_data:
-            if Youtuber.query.filter_by(channel_name=channel).first() is not None:
+            if channel in channel_ids:
                 r = random.uniform(0, 10)
                 vol = 1 + (r / 10)
+                day_prices[channel] = int(historical_data[channel] * vol)
                 new_stat = ChannelStats(
-                    youtuber_id=Youtuber.query.filter_by(channel_name=channel)
-                    .first()
-                    .id,
+                    youtuber_id=channel_ids[channel],
                     day=i,
-                    view_count=int(historical_data[channel] * vol),
+                    view_count=day_prices[channel],
                 )
                 db.session.add(new_stat)
-                db.session.commit()
+                written += 1
+        db.session.commit()
+        if progress:
+            progress((i + 1) / days, f"day {i + 1}/{days}")
 
-    return "hi"
+    return {"days": days, "stats_written": written}
+
+
+def _stats_history_query():
+    return (
+        db.session.query(Youtuber.channel_name, ChannelStats.day, ChannelStats.view_count)
+        .join(ChannelStats, ChannelStats.youtuber_id == Youtuber.id)
+        .order_by(ChannelStats.id)
+    )
+
+
+def get_market_analytics() -> MarketAnalytics:
+    """The shared MarketAnalytics, synced with ChannelStats.
+
+    ChannelStats may be written by another process (a job worker, the serve.py
+    writer), so each call looks up the max ChannelStats and StatsRetirement
+    ids, both cheap rowid lookups. New stats are loaded incrementally; after a
+    retirement (or if the table shrank) the history is rebuilt.
+    """
+    global market_analytics, _market_analytics_synced
+    with _market_analytics_lock:
+        synced = (
+            db.session.query(db.func.max(ChannelStats.id)).scalar() or 0,
+            db.session.query(db.func.max(StatsRetirement.id)).scalar() or 0,
+        )
+        if synced == _market_analytics_synced:
+            return market_analytics
+
+        loaded_id, loaded_retirement = _market_analytics_synced
+        max_id, retirement = synced
+        if retirement == loaded_retirement and max_id > loaded_id:
+            # only appends since the last sync
+            market_analytics.load(
+                _stats_history_query().filter(ChannelStats.id > loaded_id).all()
+            )
+        else:
+            analytics = MarketAnalytics()
+            analytics.load(_stats_history_query().all())
+            market_analytics = analytics
+        _market_analytics_synced = synced
+        return market_analytics
+
+
+def _analytics_args(window_default: int):
+    """Parse `window` and `k`; returns (window, k, error_response)."""
+    window = request.args.get("window", window_default, type=int)
+    k = request.args.get("k", 10, type=int)
+    if window < 1 or k < 1:
+        return window, k, (jsonify({"error": "window and k must be >= 1"}), 400)
+    return window, k, None
+
+
+@app.route("/analytics/movers/")
+def analytics_movers():
+    """Top gainers and losers over the last `window` days."""
+    window, k, error = _analytics_args(7)
+    if error:
+        return error
+    analytics = get_market_analytics()
+    return jsonify({"version": analytics.version, **analytics.top_movers(window, k)})
+
+
+@app.route("/analytics/trending/")
+def analytics_trending():
+    """Channels with the strongest risk-adjusted momentum."""
+    window, k, error = _analytics_args(14)
+    if error:
+        return error
+    analytics = get_market_analytics()
+    return jsonify(
+        {"version": analytics.version, "trending": analytics.trending(window, k)}
+    )
+
+
+@app.route("/analytics/correlation/")
+def analytics_correlation():
+    """Either `?channel=X&k=10` (most correlated with X) or `?channels=A,B,C` (matrix)."""
+    window, k, error = _analytics_args(30)
+    if error:
+        return error
+    analytics = get_market_analytics()
+    channel = request.args.get("channel")
+    if channel:
+        return jsonify(
+            {
+                "version": analytics.version,
+                "channel": channel,
+                "most_correlated": analytics.most_correlated(channel, window, k),
+            }
+        )
+    channels = [c for c in request.args.get("channels", "").split(",") if c]
+    if not channels:
+        return jsonify({"error": "pass channel=<name> or channels=<a,b,...>"}), 400
+    return jsonify(
+        {"version": analytics.version, **analytics.correlation_matrix(channels, window)}
+    )
 
 
 def _seed(seed: int):
@@ -449,5 +862,21 @@ def map_stats_to_price_and_vol(viewCount):
 #     return {"start": start, "end": end, "return": ret, "daily_vol": vol}
 
 
+def _serves_requests_here() -> bool:
+    """False only in the debug reloader's watcher process, which never serves."""
+    if os.environ.get("WERKZEUG_RUN_MAIN"):
+        return True
+    # `python app.py` and `flask run --debug` start the reloader from here
+    return not (app.debug or __name__ == "__main__")
+
+
+# Start job workers in whichever process serves requests (after all tasks above
+# are registered). JOB_WORKERS=0 disables them for processes that run their own,
+# like `python jobs.py` and `python serve.py`.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+if JOB_WORKERS > 0 and _serves_requests_here():
+    start_workers(job_queue, JOB_WORKERS)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
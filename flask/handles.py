@@ -0,0 +1,216 @@
+"""Loading the channel handle universe and detecting changes to it.
+
+`iter_handles` streams handles out of the CSV-like handles file one line at a
+time, so very large files (100k+ handles) never need to be loaded as a whole.
+`HandleLoader` remembers the file's mtime, size and content hash between runs
+so an unchanged file costs a single `stat`, and `diff_handles` works out which
+handles were added or removed so only those need to be fetched or retired.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Default handles file (repo root, relative to this module)
+HANDLES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "popular_channel_handles.txt"
+)
+
+
+def _parse_line(line: str) -> Optional[str]:
+    line = line.strip()
+    if not line or line.startswith("```"):
+        return None
+    # skip header
+    if line.lower().startswith("channel,handle"):
+        return None
+    parts = line.split(",", 2)
+    handle = parts[1] if len(parts) >= 2 else parts[0]
+    # sanitize handle: strip quotes and whitespace
+    handle = handle.strip().strip('"').strip("'")
+    return handle or None
+
+
+def iter_handles(file_path: str = HANDLES_FILE, hasher=None) -> Iterator[str]:
+    """Yield handles from a CSV-like file, one at a time.
+
+    The file format is expected to have a header like `Channel,Handle / URL name,Notes`.
+    Each non-empty line yields its second column (or first, if there is only one).
+    If `hasher` is given, every raw line is fed to it as it is read.
+    """
+    with open(file_path, "rb") as f:
+        for raw in f:
+            if hasher is not None:
+                hasher.update(raw)
+            handle = _parse_line(raw.decode("utf-8", errors="replace"))
+            if handle:
+                yield handle
+
+
+def load_handles(file_path: str = HANDLES_FILE) -> List[str]:
+    """Load handles from a CSV-like file. Returns list of handle strings.
+
+    Duplicates are dropped, keeping the first occurrence.
+    """
+    try:
+        return list(dict.fromkeys(iter_handles(file_path)))
+    except FileNotFoundError:
+        print(f"Handles file not found at {file_path}. Using empty list.")
+        return []
+
+
+def normalize_handle(handle: str) -> str:
+    """Canonical form used to compare handles (case-insensitive, no leading @)."""
+    return handle.strip().lstrip("@").lower()
+
+
+def diff_handles(
+    new: Iterable[str], current: Iterable[str]
+) -> Tuple[List[str], List[str]]:
+    """Compare two handle collections.
+
+    Returns (added, removed): handles in `new` but not `current`, and handles
+    in `current` but not `new`. Comparison uses `normalize_handle`; the
+    returned values keep their original spelling.
+    """
+    new_map = {normalize_handle(h): h for h in new}
+    current_map = {normalize_handle(h): h for h in current}
+    added = [h for k, h in new_map.items() if k not in current_map]
+    removed = [h for k, h in current_map.items() if k not in new_map]
+    return added, removed
+
+
+class HandleLoader:
+    """Load a handles file only when it has actually changed.
+
+    The last seen mtime, size and sha256 are kept in a JSON file at
+    `state_path` (if given) so change detection survives restarts, along with
+    which of the file's handles were stored (and the handle each was stored
+    under) and which are still pending.
+    """
+
+    def __init__(self, file_path: str = HANDLES_FILE, state_path: Optional[str] = None):
+        self.file_path = file_path
+        self.state_path = state_path
+        self.state = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable handles state at {state_path}:", e)
+
+    @property
+    def previous_handles(self) -> List[str]:
+        """Handles stored as of the last committed load (empty on first run)."""
+        return self.state.get("handles", [])
+
+    @property
+    def stored_handles(self) -> Dict[str, str]:
+        """File handle -> handle of the channel it was stored as."""
+        return self.state.get("stored", {})
+
+    @property
+    def pending_handles(self) -> List[str]:
+        """Handles in the file that could not be stored yet and need retrying."""
+        return self.state.get("pending", [])
+
+    def load_if_changed(self) -> Optional[Tuple[List[str], dict]]:
+        """Return (handles, new_state) if the file changed, else None.
+
+        A matching mtime and size short-circuits without reading the file.
+        Otherwise the file is streamed once, hashing as it goes; if the hash
+        matches the stored one nothing has changed. Call `commit(new_state)`
+        once the returned handles have been applied, with `handles` set to the
+        ones actually stored, `stored` to the handle each was stored under and
+        `pending` to the ones still to retry.
+        """
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            print(f"Handles file not found at {self.file_path}.")
+            return None
+
+        if (
+            self.state.get("mtime") == st.st_mtime_ns
+            and self.state.get("size") == st.st_size
+        ):
+            return None
+
+        hasher = hashlib.sha256()
+        handles = list(dict.fromkeys(iter_handles(self.file_path, hasher)))
+        new_state = {
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha256": hasher.hexdigest(),
+            "handles": handles,
+        }
+        if new_state["sha256"] == self.state.get("sha256"):
+            # touched but not edited; remember the new mtime so we skip next time
+            self.commit(
+                {
+                    **new_state,
+                    "handles": self.previous_handles,
+                    "stored": self.stored_handles,
+                    "pending": self.pending_handles,
+                }
+            )
+            return None
+        return handles, new_state
+
+    def commit(self, new_state: dict):
+        """Record `new_state` as the last applied version of the file."""
+        self.state = new_state
+        if not self.state_path:
+            return
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(new_state, f)
+        os.replace(tmp, self.state_path)
+
+
+def plan_universe_update(
+    new: Iterable[str],
+    previous: Iterable[str],
+    current: Iterable[str],
+    stored: Optional[Dict[str, str]] = None,
+) -> Tuple[List[str], List[str]]:
+    """Work out which handles to fetch and which stored channels to retire.
+
+    Args:
+        new: handles now in the file
+        previous: file handles that were stored at the last applied load
+        current: handles of the channels currently stored
+        stored: file handle -> handle its channel was stored under, for
+            channels resolved to a different handle (e.g. via search);
+            handles missing from it are assumed to be stored as-is
+
+    A handle is fetched unless it was stored at the last load or matches a
+    stored channel, so handles that failed to resolve are retried.
+    A stored channel is retired only if the file handle it was stored for was
+    dropped from the file and no remaining file handle maps to it, so
+    channels are never retired by accident.
+    """
+    new = list(new)
+    current = list(current)
+    stored_keys = {
+        normalize_handle(h): normalize_handle(s) for h, s in (stored or {}).items()
+    }
+    previous_keys: Set[str] = {normalize_handle(h) for h in previous}
+    current_keys = {normalize_handle(h) for h in current}
+
+    def stored_as(handle: str) -> str:
+        key = normalize_handle(handle)
+        return stored_keys.get(key, key)
+
+    to_fetch = [
+        h
+        for h in new
+        if normalize_handle(h) not in previous_keys
+        and normalize_handle(h) not in current_keys
+    ]
+    _, dropped = diff_handles(new, previous)
+    kept = {stored_as(h) for h in new}
+    retire_keys = {stored_as(h) for h in dropped} - kept
+    to_retire = [h for h in current if normalize_handle(h) in retire_keys]
+    return to_fetch, to_retire
@@ -0,0 +1,305 @@
+"""A small SQLite-backed job queue for work too slow to run inside a request.
+
+Routes submit a job and return straight away with its id; worker threads (or
+separate worker processes pointed at the same database file) claim jobs, run
+the registered task and store its progress and result for polling.
+
+- identical jobs (same task name and arguments) that are already queued or
+  running are deduplicated: submitting again returns the existing job
+- failed jobs are retried with exponential backoff up to `max_attempts`
+- a running job whose worker stops heartbeating is requeued after `lease`
+  seconds, so a crashed worker process does not strand it
+
+Run extra worker processes with:
+
+    python jobs.py [num_threads]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import closing
+from typing import Callable, Dict, List, Optional, Tuple
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    heartbeat REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, run_after);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_inflight
+    ON jobs (dedupe_key) WHERE status IN ('queued', 'running');
+"""
+
+
+class JobContext:
+    """Handle passed to a running task so it can report progress."""
+
+    def __init__(self, queue: "JobQueue", job_id: int, worker: str):
+        self.queue = queue
+        self.id = job_id
+        self.worker = worker
+
+    def progress(self, fraction: float, message: Optional[str] = None):
+        """Record progress in [0, 1] with an optional status message."""
+        self.queue._update(
+            self.id,
+            owner=self.worker,
+            progress=max(0.0, min(1.0, float(fraction))),
+            message=message,
+            heartbeat=time.time(),
+        )
+
+
+class JobQueue:
+    """Persistent FIFO of named jobs stored in a SQLite file."""
+
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = 3,
+        backoff: float = 5.0,
+        lease: float = 300.0,
+    ):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.tasks: Dict[str, Callable] = {}
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def task(self, name: str):
+        """Decorator registering `fn(job, **kwargs)` as the task called `name`."""
+
+        def register(fn):
+            self.tasks[name] = fn
+            return fn
+
+        return register
+
+    # -----------------------------
+    # Producer side
+    # -----------------------------
+    def submit(self, name: str, **kwargs) -> Tuple[int, bool]:
+        """Queue a job, or find the identical one already in flight.
+
+        Returns (job_id, created).
+        """
+        if name not in self.tasks:
+            raise KeyError(f"Unknown job: {name}")
+        args = json.dumps(kwargs, sort_keys=True)
+        dedupe_key = f"{name}:{args}"
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)",
+                (dedupe_key, QUEUED, RUNNING),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row["id"], False
+            cur = conn.execute(
+                "INSERT INTO jobs (name, args, dedupe_key, status, max_attempts,"
+                " run_after, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, args, dedupe_key, QUEUED, self.max_attempts, now, now, now),
+            )
+            conn.execute("COMMIT")
+            return cur.lastrowid, True
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """Return a job's public state as a dict, or None if it does not exist."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "name": row["name"],
+            "args": json.loads(row["args"]),
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "progress": row["progress"],
+            "message": row["message"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    # -----------------------------
+    # Worker side
+    # -----------------------------
+    def claim(self, worker: str) -> Optional[sqlite3.Row]:
+        """Atomically take the oldest runnable job, marking it running."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # jobs whose worker stopped heartbeating: fail them if they are out
+            # of attempts (e.g. they keep crashing the worker), else requeue
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, error = ?, updated_at = ?"
+                " WHERE status = ? AND heartbeat < ? AND attempts >= max_attempts",
+                (FAILED, "worker lost", now, RUNNING, now - self.lease),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, progress = 0,"
+                " message = ?, updated_at = ?"
+                " WHERE status = ? AND heartbeat < ?",
+                (QUEUED, "worker lost; requeued", now, RUNNING, now - self.lease),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND run_after <= ?"
+                " ORDER BY run_after, id LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,"
+                    " heartbeat = ?, updated_at = ? WHERE id = ?",
+                    (RUNNING, worker, now, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        return row
+
+    def run_one(self, worker: str) -> bool:
+        """Claim and run a single job. Returns False if nothing was runnable."""
+        row = self.claim(worker)
+        if row is None:
+            return False
+        job = JobContext(self, row["id"], worker)
+        attempt = row["attempts"] + 1
+        fn = self.tasks.get(row["name"])
+        done = threading.Event()
+        beat = threading.Thread(
+            target=self._heartbeat, args=(row["id"], worker, done), daemon=True
+        )
+        beat.start()
+        try:
+            if fn is None:
+                raise KeyError(f"Unknown job: {row['name']}")
+            result = fn(job, **json.loads(row["args"]))
+        except Exception as e:
+            err = "".join(traceback.format_exception_only(type(e), e)).strip()
+            print(f"Job {row['id']} ({row['name']}) attempt {attempt} failed:", err)
+            if attempt < row["max_attempts"]:
+                delay = self.backoff * (2 ** (attempt - 1))
+                self._update(
+                    row["id"],
+                    owner=worker,
+                    status=QUEUED,
+                    worker=None,
+                    progress=0.0,
+                    run_after=time.time() + delay,
+                    error=err,
+                    message=f"retrying in {delay:.0f}s",
+                )
+            else:
+                self._update(row["id"], owner=worker, status=FAILED, error=err)
+            return True
+        finally:
+            done.set()
+
+        self._update(
+            row["id"],
+            owner=worker,
+            status=SUCCEEDED,
+            progress=1.0,
+            result=json.dumps(result, default=str),
+            error=None,
+        )
+        return True
+
+    def _heartbeat(self, job_id: int, worker: str, done: threading.Event):
+        # keep the lease alive for tasks that never report progress
+        while not done.wait(self.lease / 3):
+            self._update(job_id, owner=worker, heartbeat=time.time())
+
+    def _update(self, job_id: int, owner: Optional[str] = None, **fields) -> bool:
+        """Update a job's columns; with `owner`, only while that worker holds it.
+
+        Returns False if the job was not updated (e.g. it was requeued after
+        its lease expired and another worker now owns it).
+        """
+        fields["updated_at"] = time.time()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        sql = f"UPDATE jobs SET {cols} WHERE id = ?"
+        params = [*fields.values(), job_id]
+        if owner is not None:
+            sql += " AND worker = ? AND status = ?"
+            params += [owner, RUNNING]
+        with closing(self._connect()) as conn:
+            return conn.execute(sql, params).rowcount > 0
+
+
+def work(queue: JobQueue, stop: threading.Event = None, poll: float = 1.0):
+    """Worker loop: run jobs until `stop` is set, sleeping `poll`s when idle."""
+    worker = f"{os.getpid()}-{threading.current_thread().name}-{uuid.uuid4().hex[:6]}"
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            ran = queue.run_one(worker)
+        except sqlite3.OperationalError as e:
+            # e.g. database locked for longer than the timeout; try again later
+            print("Job worker error:", e)
+            ran = False
+        if not ran:
+            stop.wait(poll)
+
+
+def start_workers(queue: JobQueue, n: int = 2) -> List[threading.Thread]:
+    """Start `n` daemon worker threads for `queue` and return them."""
+    threads = []
+    for i in range(n):
+        t = threading.Thread(
+            target=work, args=(queue,), daemon=True, name=f"job-worker-{i}"
+        )
+        t.start()
+        threads.append(t)
+    return threads
+
+
+if __name__ == "__main__":
+    N = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    # importing the app registers its tasks on app.job_queue; this process runs
+    # its own workers below, so the app must not start its default ones
+    os.environ["JOB_WORKERS"] = "0"
+    from app import job_queue
+
+    print(f"Starting {N} job worker thread(s) on {job_queue.path}")
+    start_workers(job_queue, N)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print("Job workers stopped by user.")
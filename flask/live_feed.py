@@ -1,71 +1,43 @@
 import time
 import os
-import googleapiclient.discovery
 from dotenv import load_dotenv
 import threading
 from typing import List
 
+from handles import load_handles
+from sources import resolve_youtube_channel
+from yt_client import QuotaExceeded, get_client
+
 load_dotenv()
 YT_API_KEY = os.getenv("YOUTUBE_API_KEY")
 
-# Default handles file (repo root, relative to this module)
-HANDLES_FILE = os.path.join(os.path.dirname(__file__), "..", "popular_channel_handles.txt")
-
 
-def get_channel_info_by_handle(handle: str):
+def get_channel_info_by_handle(handle: str, max_age: float = None):
     """Call YouTube API channels.list for a handle and return a simplified dict.
 
+    `max_age` limits how stale a cached response may be (see yt_client).
     Returns None on error or missing API key.
     """
-    if not YT_API_KEY:
+    client = get_client()
+    if not YT_API_KEY and not client.replay:
         print("No YOUTUBE_API_KEY found in environment; cannot fetch live data.")
         return None
-    # build client once per call
-    youtube = googleapiclient.discovery.build("youtube", "v3", developerKey=YT_API_KEY)
 
-    # Try multiple strategies to resolve a handle/name to channel information.
-    attempts = [
-        {"params": {"part": "snippet,statistics", "forHandle": handle}},
-        {"params": {"part": "snippet,statistics", "forUsername": handle}},
-    ]
-
-    # perform attempts with short retry on transient errors
-    for attempt in attempts:
-        try:
-            req = youtube.channels().list(**attempt["params"])
-            res = req.execute()
-            items = res.get("items", [])
-            if items:
-                c = items[0]
-                return {"channel_name": c["snippet"]["title"], "statistics": c["statistics"]}
-        except Exception as e:
-            # transient error — try next strategy
-            print(f"YouTube API attempt failed ({attempt['params'].keys()}):", e)
-
-    # Fallback: search by query to find likely channel id, then fetch by id
     try:
-        sreq = youtube.search().list(part="snippet", q=handle, type="channel", maxResults=1)
-        sres = sreq.execute()
-        items = sres.get("items", [])
-        if items:
-            channel_id = items[0]["snippet"]["channelId"]
-            creq = youtube.channels().list(part="snippet,statistics", id=channel_id)
-            cres = creq.execute()
-            citems = cres.get("items", [])
-            if citems:
-                c = citems[0]
-                return {"channel_name": c["snippet"]["title"], "statistics": c["statistics"]}
-    except Exception as e:
-        print("YouTube search fallback failed:", e)
-
-    return None
+        channel = resolve_youtube_channel(client, handle, max_age=max_age)
+    except QuotaExceeded as e:
+        print("YouTube quota exhausted:", e)
+        return None
+    if channel is None:
+        return None
+    return {"channel_name": channel["snippet"]["title"], "statistics": channel["statistics"]}
 
 
 def live_feed(handle: str, interval: int = 45):
     """Continuously print live stats for a channel every `interval` seconds."""
     try:
         while True:
-            data = get_channel_info_by_handle(handle)
+            data = get_channel_info_by_handle(handle, max_age=interval)
             if data:
                 stats = data["statistics"]
                 subs = stats.get("subscriberCount")
@@ -78,37 +50,6 @@ def live_feed(handle: str, interval: int = 45):
         print("Live feed stopped by user.")
 
 
-def load_handles(file_path: str = HANDLES_FILE) -> List[str]:
-    """Load handles from a CSV-like file. Returns list of handle strings.
-
-    The file format is expected to have a header like `Channel,Handle / URL name,Notes`.
-    We parse each non-empty line, skip fences, and return the second column when present.
-    """
-    handles = []
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith("```"):
-                    continue
-                # skip header
-                if line.lower().startswith("channel,handle"):
-                    continue
-                parts = line.split(",", 2)
-                if len(parts) >= 2:
-                    handle = parts[1].strip()
-                else:
-                    handle = parts[0].strip()
-                # sanitize handle: strip quotes and whitespace
-                if handle:
-                    handle = handle.strip().strip('"').strip("'")
-                    # For API, allow both with and without leading @. Keep as-is.
-                    handles.append(handle)
-    except FileNotFoundError:
-        print(f"Handles file not found at {file_path}. Using empty list.")
-    return handles
-
-
 def start_live_for_handles(handles: List[str], interval: int = 45, max_threads: int = 10):
     """Start live_feed in a daemon thread for up to `max_threads` handles.
 
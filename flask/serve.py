@@ -0,0 +1,107 @@
+"""Multi-process serving: one writer process, N read-only API workers.
+
+    python serve.py [num_workers]
+
+The writer process owns everything that changes market state: it runs the
+background job workers (ingestion, historical data) and, every
+`MARKET_TICK_SECONDS`, rebuilds the channel/price snapshot and publishes it
+to an mmap file (see snapshot.py). Worker processes share one listening socket
+and answer requests; the channel and price endpoints read the published
+snapshot lock-free instead of querying the DB and recomputing prices, so read
+throughput scales with the number of workers.
+
+Each worker handles one request at a time (parallelism comes from processes),
+which also keeps each worker's `SnapshotReader` single-threaded. In-memory
+state such as `portfolio_book` is per process, so the portfolio routes answer
+503 in this mode; use the single-process `python app.py` for trading.
+"""
+import multiprocessing as mp
+import os
+import socket
+import sys
+import time
+
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "5000"))
+TICK_SECONDS = float(os.getenv("MARKET_TICK_SECONDS", "60"))
+SNAPSHOT_PATH = os.getenv(
+    "MARKET_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "market.snap"),
+)
+
+
+def run_writer(job_workers: int):
+    from snapshot import SnapshotWriter
+    import app as stonks
+    from jobs import start_workers
+
+    writer = SnapshotWriter(SNAPSHOT_PATH)
+    start_workers(stonks.job_queue, job_workers)
+    while True:
+        start = time.perf_counter()
+        try:
+            with stonks.app.app_context():
+                version = writer.publish(stonks.build_market_snapshot())
+            print(
+                f"Published market snapshot v{version} "
+                f"in {time.perf_counter() - start:.3f}s"
+            )
+        except Exception as e:
+            print("Market snapshot publish failed:", e)
+        time.sleep(TICK_SECONDS)
+
+
+def run_worker(fd: int):
+    from werkzeug.serving import make_server
+    import app as stonks
+
+    server = make_server(HOST, PORT, stonks.app, fd=fd)
+    server.serve_forever()
+
+
+def main(num_workers: int):
+    os.environ["MARKET_SNAPSHOT"] = SNAPSHOT_PATH
+    # only the writer runs job workers, started explicitly in run_writer
+    writer_job_workers = os.getenv("JOB_WORKERS", "2")
+    os.environ["JOB_WORKERS"] = "0"
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+    # a leftover snapshot from a previous run would be served until the first tick
+    if os.path.exists(SNAPSHOT_PATH):
+        os.remove(SNAPSHOT_PATH)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # fork so the workers inherit the listening socket
+    ctx = mp.get_context("fork")
+    procs = [
+        ctx.Process(
+            target=run_writer,
+            args=(int(writer_job_workers),),
+            name="market-writer",
+            daemon=True,
+        )
+    ]
+    procs += [
+        ctx.Process(target=run_worker, args=(sock.fileno(),), name=f"api-{i}", daemon=True)
+        for i in range(num_workers)
+    ]
+    for p in procs:
+        p.start()
+    print(f"Serving on http://{HOST}:{PORT} with {num_workers} workers + 1 writer")
+
+    try:
+        while all(p.is_alive() for p in procs):
+            time.sleep(1)
+        print("A serving process exited; shutting down.")
+    except KeyboardInterrupt:
+        print("Stopping server")
+    for p in procs:
+        p.terminate()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 2)
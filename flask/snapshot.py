@@ -0,0 +1,194 @@
+"""Publishing a read-only market snapshot to many processes through mmap.
+
+One writer process owns the snapshot file. Each `publish` serializes the
+market state into whichever of the two payload slots is not currently live,
+then flips the header to point at it and bumps the version. Readers in any
+number of worker processes map the same file and never take a lock:
+
+- the header is guarded by a sequence counter (odd while the writer is
+  updating it, and only made even again after every field is written), so a
+  reader that races a flip simply retries
+- a reader only decodes when the version changes; otherwise it hands back
+  the object it already decoded, so the hot path is one 8-byte header read
+- `encoded` also caches JSON response bodies per version, so serving a
+  section of the snapshot does not re-serialize it on every request
+- if a payload outgrows its slot the writer builds a bigger file, swaps it
+  in with `os.replace` and marks the old mapping stale so readers reopen it
+
+File layout: a fixed header followed by two slots of `capacity` bytes each.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Callable, Dict, Optional
+
+MAGIC = b"STONKSMK"
+# magic, seq, version, active slot, stale flag, capacity, len slot 0, len slot 1
+HEADER = struct.Struct("<8sQQIIQQQ")
+HEADER_SIZE = 64
+SEQ_OFFSET = 8
+DEFAULT_CAPACITY = 1 << 20
+
+
+class SnapshotWriter:
+    """Owns the snapshot file and publishes new versions into it."""
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        self.version = 0
+        self._seq = 0
+        self._active = 0
+        self._lens = [0, 0]
+        self._file, self._mm = self._create(capacity)
+
+    def _create(self, capacity: int):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(HEADER_SIZE + 2 * capacity)
+        f = open(tmp, "r+b")
+        mm = mmap.mmap(f.fileno(), 0)
+        self.capacity = capacity
+        self._write_header(mm)
+        os.replace(tmp, self.path)
+        return f, mm
+
+    def _write_header(self, mm, stale: int = 0):
+        # seqlock: store an odd seq on its own first, write the fields while it
+        # is odd, then store the next even seq on its own as the very last write,
+        # so a reader can never pair a stable seq with a half-written header
+        self._seq += 1
+        mm[SEQ_OFFSET:SEQ_OFFSET + 8] = struct.pack("<Q", self._seq)
+        mm[:HEADER.size] = HEADER.pack(
+            MAGIC,
+            self._seq,
+            self.version,
+            self._active,
+            stale,
+            self.capacity,
+            self._lens[0],
+            self._lens[1],
+        )
+        self._seq += 1
+        mm[SEQ_OFFSET:SEQ_OFFSET + 8] = struct.pack("<Q", self._seq)
+
+    def publish(self, snapshot: Dict) -> int:
+        """Make `snapshot` (any JSON-serializable dict) the live version.
+
+        Returns the new version number.
+        """
+        data = json.dumps(
+            {"version": self.version + 1, "published_at": time.time(), **snapshot},
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+        if len(data) > self.capacity:
+            old_file, old_mm = self._file, self._mm
+            self._active, self._lens = 0, [0, 0]
+            self._file, self._mm = self._create(max(len(data) * 2, self.capacity * 2))
+            # readers still mapping the old file will see this and reopen
+            self._write_header(old_mm, stale=1)
+            old_mm.close()
+            old_file.close()
+
+        slot = 1 - self._active
+        start = HEADER_SIZE + slot * self.capacity
+        self._mm[start:start + len(data)] = data
+
+        self.version += 1
+        self._active = slot
+        self._lens[slot] = len(data)
+        self._write_header(self._mm)
+        return self.version
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+class SnapshotReader:
+    """Lock-free reader for a file published by `SnapshotWriter`."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mm = None
+        self._version = None
+        self._snapshot = None
+        self._encoded: Dict[str, bytes] = {}
+        self._encoded_version = None
+
+    def _open(self) -> bool:
+        self.close()
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def read(self, retries: int = 100) -> Optional[Dict]:
+        """Return the live snapshot, or None if nothing has been published yet."""
+        if self._mm is None and not self._open():
+            return None
+        for _ in range(retries):
+            seq1 = struct.unpack_from("<Q", self._mm, SEQ_OFFSET)[0]
+            if seq1 & 1:
+                continue
+            magic, _, version, active, stale, capacity, len0, len1 = (
+                HEADER.unpack_from(self._mm, 0)
+            )
+            if magic != MAGIC:
+                return None
+            if stale:
+                if not self._open():
+                    return None
+                continue
+            if version == self._version:
+                return self._snapshot
+            length = len0 if active == 0 else len1
+            if length == 0:
+                # freshly created file, nothing published into it yet
+                return self._snapshot
+            start = HEADER_SIZE + active * capacity
+            data = self._mm[start:start + length]
+            if struct.unpack_from("<Q", self._mm, SEQ_OFFSET)[0] != seq1:
+                continue
+            self._snapshot = json.loads(data)
+            self._version = version
+            return self._snapshot
+        # writer is publishing faster than we can read; serve what we have
+        return self._snapshot
+
+    def encoded(
+        self, key: str, build: Optional[Callable[[Dict], object]] = None
+    ) -> Optional[bytes]:
+        """JSON bytes of `build(snapshot)` (default: `snapshot[key]`).
+
+        Encoded once per published version and cached under `key`. Returns
+        None if nothing has been published yet.
+        """
+        snapshot = self.read()
+        if snapshot is None:
+            return None
+        if self._encoded_version != self._version:
+            self._encoded = {}
+            self._encoded_version = self._version
+        body = self._encoded.get(key)
+        if body is None:
+            value = build(snapshot) if build else snapshot[key]
+            body = json.dumps(value, separators=(",", ":")).encode("utf-8")
+            self._encoded[key] = body
+        return body
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._mm = None
+        self._file = None
@@ -0,0 +1,377 @@
+"""Pluggable metric sources and a shared ingestion pipeline.
+
+Each platform is wrapped in a `SourceAdapter` that turns a handle into a
+normalized `MetricRecord` (followers, views, engagement). `ingest` fans the
+handles out per source (each with its own concurrency and rate budget), then
+dedupes and batches the records before handing them to a sink, which is where
+the DB writes and pricing happen (see `app.write_metric_records`).
+
+File-backed fake adapters let a large multi-source universe be ingested and
+benchmarked offline:
+
+    python sources.py --bench 10000
+"""
+import csv
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from ratelimit import RateBudget
+from yt_client import QuotaExceeded, YouTubeClient, get_client
+
+
+@dataclass
+class MetricRecord:
+    """A single normalized metric observation for one entity on one platform."""
+
+    platform: str
+    handle: str
+    name: str
+    followers: int = 0
+    views: int = 0
+    engagement: float = 0.0
+    profile_pic: Optional[str] = None
+    fetched_at: float = 0.0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.platform, self.handle.lower())
+
+
+class SourceAdapter:
+    """Base class for a platform metric source.
+
+    Subclasses set `platform` and implement `fetch`, returning a `MetricRecord`
+    for a handle or None when it cannot be resolved.
+    """
+
+    platform = "unknown"
+
+    def __init__(self, max_concurrency: int = 4, rate_per_sec: float = 0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.budget = RateBudget(rate_per_sec)
+
+    def fetch(self, handle: str) -> Optional[MetricRecord]:
+        raise NotImplementedError
+
+    def fetch_limited(self, handle: str) -> Optional[MetricRecord]:
+        """Fetch a handle after waiting on this source's rate budget."""
+        self.budget.acquire()
+        try:
+            return self.fetch(handle)
+        except QuotaExceeded:
+            # every later call would fail too; let ingest stop the whole run
+            raise
+        except Exception as e:
+            print(f"[{self.platform}] fetch failed for {handle}:", e)
+            return None
+
+
+# -----------------------------
+# YouTube
+# -----------------------------
+def resolve_youtube_channel(
+    client: YouTubeClient, handle: str, max_age: Optional[float] = None
+) -> Optional[Dict]:
+    """Resolve a handle/name to a raw YouTube `channels` item.
+
+    Tries forHandle, then forUsername, then falls back to a channel search.
+    `max_age` bounds how old a cached channels response may be; the search
+    step always uses the client's default since a handle rarely moves.
+    Returns None if nothing matches. QuotaExceeded is not swallowed, so callers
+    stop rather than burning what is left on the expensive search fallback.
+    """
+    attempts = [
+        {"part": "snippet,statistics", "forHandle": handle},
+        {"part": "snippet,statistics", "forUsername": handle},
+    ]
+    for params in attempts:
+        try:
+            res = client.channels_list(max_age=max_age, **params)
+            items = res.get("items", [])
+            if items:
+                return items[0]
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            # transient error — try next strategy
+            print(f"YouTube API attempt failed ({params.keys()}):", e)
+
+    # Fallback: search by query to find likely channel id, then fetch by id
+    try:
+        sres = client.search_list(part="snippet", q=handle, type="channel", maxResults=1)
+        items = sres.get("items", [])
+        if items:
+            channel_id = items[0]["snippet"]["channelId"]
+            cres = client.channels_list(
+                max_age=max_age, part="snippet,statistics", id=channel_id
+            )
+            citems = cres.get("items", [])
+            if citems:
+                return citems[0]
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        print("YouTube search fallback failed:", e)
+
+    return None
+
+
+class YouTubeAdapter(SourceAdapter):
+    """Metric source backed by the YouTube Data API v3.
+
+    Rate limiting, quota and caching are handled by the shared client, so the
+    adapter itself only bounds concurrency.
+    """
+
+    platform = "youtube"
+
+    def __init__(self, client: Optional[YouTubeClient] = None, **kwargs):
+        kwargs.setdefault("max_concurrency", 4)
+        super().__init__(**kwargs)
+        self.client = client or get_client()
+
+    def fetch(self, handle: str) -> Optional[MetricRecord]:
+        channel = resolve_youtube_channel(self.client, handle)
+        if channel is None:
+            return None
+        return youtube_channel_to_record(channel, handle)
+
+
+def youtube_channel_to_record(channel: Dict, handle: str) -> MetricRecord:
+    """Normalize a raw YouTube `channels` item into a MetricRecord."""
+    snippet = channel.get("snippet", {})
+    stats = channel.get("statistics", {})
+    followers = int(stats.get("subscriberCount", 0) or 0)
+    views = int(stats.get("viewCount", 0) or 0)
+    videos = int(stats.get("videoCount", 0) or 0)
+    # average views per subscriber per video as a rough engagement proxy
+    engagement = views / (followers * videos) if followers and videos else 0.0
+    return MetricRecord(
+        platform="youtube",
+        handle=snippet.get("customUrl") or handle,
+        name=snippet.get("title", handle),
+        followers=followers,
+        views=views,
+        engagement=float(engagement),
+        profile_pic=snippet.get("thumbnails", {}).get("default", {}).get("url"),
+        fetched_at=time.time(),
+    )
+
+
+# -----------------------------
+# File-backed fakes
+# -----------------------------
+FAKE_FIELDS = ["handle", "name", "followers", "views", "engagement"]
+
+
+class FileAdapter(SourceAdapter):
+    """Fake source that serves metrics from a CSV file, for offline runs.
+
+    The file needs a header with `handle,name,followers,views,engagement`.
+    An optional `latency` (seconds) simulates network time per fetch.
+    """
+
+    def __init__(self, platform: str, path: str, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.platform = platform
+        self.path = path
+        self.latency = latency
+        self._rows = {}
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                self._rows[row["handle"].lower()] = row
+
+    def handles(self) -> List[str]:
+        return [row["handle"] for row in self._rows.values()]
+
+    def fetch(self, handle: str) -> Optional[MetricRecord]:
+        if self.latency:
+            time.sleep(self.latency)
+        row = self._rows.get(handle.lower())
+        if row is None:
+            return None
+        return MetricRecord(
+            platform=self.platform,
+            handle=row["handle"],
+            name=row.get("name") or row["handle"],
+            followers=int(row.get("followers") or 0),
+            views=int(row.get("views") or 0),
+            engagement=float(row.get("engagement") or 0.0),
+            fetched_at=time.time(),
+        )
+
+
+def write_fake_universe(
+    directory: str,
+    platforms: Iterable[str] = ("youtube", "twitter", "instagram", "tiktok"),
+    total: int = 10000,
+    seed: int = 42,
+) -> Dict[str, str]:
+    """Write one fake metrics CSV per platform, `total` entities overall.
+
+    Returns a dict mapping platform -> file path.
+    """
+    import random
+
+    rng = random.Random(seed)
+    platforms = list(platforms)
+    paths = {}
+    per_platform = total // len(platforms)
+    for p_idx, platform in enumerate(platforms):
+        count = per_platform + (1 if p_idx < total % len(platforms) else 0)
+        path = os.path.join(directory, f"{platform}_metrics.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(FAKE_FIELDS)
+            for i in range(count):
+                followers = int(rng.lognormvariate(11, 2))
+                writer.writerow(
+                    [
+                        f"{platform}_user{i}",
+                        f"{platform.title()} User {i}",
+                        followers,
+                        int(followers * rng.uniform(5, 500)),
+                        round(rng.uniform(0.001, 0.15), 5),
+                    ]
+                )
+        paths[platform] = path
+    return paths
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+def ingest(
+    jobs: List[Tuple[SourceAdapter, Iterable[str]]],
+    sink: Callable[[List[MetricRecord]], None],
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """Fetch every (adapter, handles) pair and stream deduped batches to `sink`.
+
+    Each adapter gets its own worker pool sized by `max_concurrency` and is
+    throttled by its own rate budget, so a slow or strict platform does not
+    hold up the others. Records are deduped on (platform, handle); if the same
+    entity is seen twice the most recently fetched record wins, even when the
+    older one already went out in an earlier batch (the newer one is then sent
+    again in a later batch). The sink runs outside the collection lock, one
+    batch at a time, so a slow DB write does not stall the other sources.
+
+    Returns counters (fetched, missing, duplicates, written, batches) plus
+    `unresolved`, the requested handles that produced no record, and
+    `resolved`, mapping each requested handle to the handle of the record it
+    produced (these can differ, e.g. for a YouTube channel found by search).
+    If a source raises QuotaExceeded its remaining handles are cancelled and the
+    error propagates (after flushing what was already fetched), so a job
+    running the ingest fails and is retried later.
+    """
+    counts = {"fetched": 0, "missing": 0, "duplicates": 0, "written": 0, "batches": 0}
+    pending: Dict[Tuple[str, str], MetricRecord] = {}
+    # fetched_at of the newest record accepted per key, flushed or not
+    latest: Dict[Tuple[str, str], float] = {}
+    unresolved: List[str] = []
+    resolved: Dict[str, str] = {}
+    # batches are queued under `lock` and written in that order under
+    # `sink_lock`, so a newer record is never overwritten by an older batch
+    ready: Deque[List[MetricRecord]] = deque()
+    lock = threading.Lock()
+    sink_lock = threading.Lock()
+
+    def take_batch():
+        # caller holds `lock`
+        if pending:
+            ready.append(list(pending.values()))
+            pending.clear()
+
+    def drain():
+        with sink_lock:
+            while True:
+                with lock:
+                    if not ready:
+                        return
+                    batch = ready.popleft()
+                sink(batch)
+                with lock:
+                    counts["written"] += len(batch)
+                    counts["batches"] += 1
+
+    def collect(handle: str, record: Optional[MetricRecord]):
+        with lock:
+            if record is None:
+                counts["missing"] += 1
+                unresolved.append(handle)
+                return
+            counts["fetched"] += 1
+            resolved[handle] = record.handle
+            key = record.key
+            if key in latest:
+                counts["duplicates"] += 1
+                if latest[key] > record.fetched_at:
+                    return
+            latest[key] = record.fetched_at
+            pending[key] = record
+            if len(pending) >= batch_size:
+                take_batch()
+        drain()
+
+    def run_source(adapter: SourceAdapter, handles: Iterable[str]):
+        unique = list(dict.fromkeys(h for h in handles if h))
+        pool = ThreadPoolExecutor(
+            max_workers=adapter.max_concurrency,
+            thread_name_prefix=f"ingest-{adapter.platform}",
+        )
+        try:
+            futures = [pool.submit(adapter.fetch_limited, h) for h in unique]
+            for handle, fut in zip(unique, futures):
+                collect(handle, fut.result())
+        finally:
+            # on QuotaExceeded (or any error), drop the handles not yet started
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as sources:
+            futures = [sources.submit(run_source, a, h) for a, h in jobs]
+            for fut in futures:
+                fut.result()
+    except QuotaExceeded:
+        # keep what was fetched before the quota ran out, then fail the run
+        with lock:
+            take_batch()
+        drain()
+        raise
+
+    with lock:
+        take_batch()
+    drain()
+    counts["unresolved"] = unresolved
+    counts["resolved"] = resolved
+    return counts
+
+
+def _bench(total: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_fake_universe(tmp, total=total)
+        adapters = [
+            FileAdapter(platform, path, max_concurrency=8)
+            for platform, path in paths.items()
+        ]
+        written = []
+        start = time.perf_counter()
+        counts = ingest([(a, a.handles()) for a in adapters], written.extend)
+        elapsed = time.perf_counter() - start
+        print(f"Ingested {len(written)} records from {len(adapters)} sources")
+        print("Counts:", {k: v for k, v in counts.items() if isinstance(v, int)})
+        print(f"Elapsed: {elapsed:.3f}s ({len(written) / elapsed:,.0f} records/s)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        _bench(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        print("Usage: python sources.py --bench [N]")
@@ -0,0 +1,48 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from analytics import MarketAnalytics
+
+
+@pytest.fixture
+def market():
+    m = MarketAnalytics()
+    m.set_day(0, {"A": 100.0, "B": 100.0, "C": 100.0, "Z": 0.0, "N": 5.0})
+    m.set_day(1, {"A": 103.0, "B": 99.0, "C": 100.0, "Z": 5.0})
+    m.set_day(2, {"A": 106.9, "B": 98.0, "C": 95.0, "Z": 7.0})
+    return m
+
+
+def test_top_movers_split_by_sign(market):
+    movers = market.top_movers(window=2, k=10)
+    assert [r["channel"] for r in movers["gainers"]] == ["A"]
+    assert [r["channel"] for r in movers["losers"]] == ["C", "B"]
+    assert movers["gainers"][0]["return"] == pytest.approx(0.069)
+
+    top = market.top_movers(window=2, k=1)
+    assert [r["channel"] for r in top["losers"]] == ["C"]
+
+
+def test_returns_off_zero_price_are_dropped(market):
+    assert np.isfinite(market.returns()[~np.isnan(market.returns())]).all()
+    # Z went 0 -> 7, which has no finite return; output must be valid JSON
+    body = json.dumps(market.top_movers(window=2, k=10), allow_nan=False)
+    assert "Z" not in body
+
+
+def test_trending_skips_channels_without_history(market):
+    ranked = [r["channel"] for r in market.trending(window=14, k=10)]
+    # N has no returns and Z only one, so neither gets ranked
+    assert ranked == ["A", "C", "B"]
+
+
+def test_results_follow_new_days(market):
+    before = market.top_movers(window=1, k=10)
+    market.set_day(3, {"B": 120.0})
+    after = market.top_movers(window=1, k=10)
+    assert before != after
+    assert after["gainers"][0]["channel"] == "B"
+    assert math.isclose(after["gainers"][0]["price"], 120.0)
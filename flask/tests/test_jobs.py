@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, backoff=0.2, lease=0.2)
+
+    @q.task("echo")
+    def echo(job, value):
+        job.progress(0.5, "halfway")
+        return {"value": value}
+
+    return q
+
+
+def test_submit_dedupes_inflight_jobs(queue):
+    job_id, created = queue.submit("echo", value=1)
+    again, created_again = queue.submit("echo", value=1)
+    other, created_other = queue.submit("echo", value=2)
+
+    assert created and not created_again
+    assert again == job_id
+    assert created_other and other != job_id
+
+
+def test_submit_after_completion_creates_new_job(queue):
+    job_id, _ = queue.submit("echo", value=1)
+    assert queue.run_one("w1")
+    assert queue.get(job_id)["status"] == SUCCEEDED
+
+    new_id, created = queue.submit("echo", value=1)
+    assert created and new_id != job_id
+
+
+def test_submit_unknown_task(queue):
+    with pytest.raises(KeyError):
+        queue.submit("nope")
+
+
+def test_run_one_stores_result(queue):
+    job_id, _ = queue.submit("echo", value="x")
+    assert queue.run_one("w1")
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["result"] == {"value": "x"}
+    assert job["progress"] == 1.0
+    assert not queue.run_one("w1")
+
+
+def test_failed_job_retries_with_backoff(queue):
+    calls = []
+
+    @queue.task("flaky")
+    def flaky(job):
+        calls.append(time.time())
+        job.progress(0.7)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    job_id, _ = queue.submit("flaky")
+    assert queue.run_one("w1")
+    job = queue.get(job_id)
+    assert job["status"] == QUEUED
+    assert job["attempts"] == 1
+    assert job["progress"] == 0.0
+    assert "boom" in job["error"]
+
+    # not runnable until the backoff has passed
+    assert not queue.run_one("w1")
+    time.sleep(0.25)
+    assert queue.run_one("w1")
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["attempts"] == 2
+    assert calls[1] - calls[0] >= 0.2
+
+
+def test_job_fails_after_max_attempts(queue):
+    @queue.task("broken")
+    def broken(job):
+        raise ValueError("always")
+
+    job_id, _ = queue.submit("broken")
+    assert queue.run_one("w1")
+    time.sleep(0.25)
+    assert queue.run_one("w1")
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["attempts"] == 2
+    assert "always" in job["error"]
+
+
+def test_expired_lease_is_requeued_to_another_worker(queue):
+    job_id, _ = queue.submit("echo", value=1)
+    assert queue.claim("lost")["id"] == job_id
+    assert queue.get(job_id)["status"] == RUNNING
+
+    # the lost worker never heartbeats; once the lease lapses the job moves on
+    assert queue.claim("w2") is None
+    time.sleep(0.25)
+    row = queue.claim("w2")
+    assert row["id"] == job_id
+
+    # the original worker can no longer touch it
+    assert not queue._update(job_id, owner="lost", status=SUCCEEDED)
+    assert queue._update(job_id, owner="w2", progress=0.5)
+    assert queue.get(job_id)["status"] == RUNNING
+
+
+def test_expired_lease_out_of_attempts_fails(queue):
+    job_id, _ = queue.submit("echo", value=1)
+    queue.claim("lost")
+    time.sleep(0.25)
+    queue.claim("lost-again")
+    time.sleep(0.25)
+
+    assert queue.claim("w3") is None
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "worker lost"
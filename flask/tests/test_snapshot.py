@@ -0,0 +1,100 @@
+import json
+import multiprocessing as mp
+
+import pytest
+
+from snapshot import SnapshotReader, SnapshotWriter
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "market.snap")
+
+
+def test_read_before_publish(path):
+    assert SnapshotReader(path).read() is None  # no file yet
+    writer = SnapshotWriter(path, capacity=1024)
+    assert SnapshotReader(path).read() is None  # file, but nothing published
+    writer.close()
+
+
+def test_publish_and_read(path):
+    writer = SnapshotWriter(path, capacity=1024)
+    reader = SnapshotReader(path)
+    assert writer.publish({"prices": {"A": 1}}) == 1
+    first = reader.read()
+    assert first["version"] == 1
+    assert first["prices"] == {"A": 1}
+    # unchanged version hands back the already decoded object
+    assert reader.read() is first
+
+    assert writer.publish({"prices": {"A": 2}}) == 2
+    assert reader.read()["prices"] == {"A": 2}
+    writer.close()
+
+
+def test_encoded_is_cached_per_version(path):
+    writer = SnapshotWriter(path, capacity=1024)
+    reader = SnapshotReader(path)
+    assert reader.encoded("prices") is None
+
+    writer.publish({"prices": {"A": 1}})
+    body = reader.encoded("prices")
+    assert json.loads(body) == {"A": 1}
+    assert reader.encoded("prices") is body
+    built = reader.encoded("both", lambda s: [s["version"], s["prices"]])
+    assert json.loads(built) == [1, {"A": 1}]
+
+    writer.publish({"prices": {"A": 2}})
+    assert json.loads(reader.encoded("prices")) == {"A": 2}
+    writer.close()
+
+
+def test_regrow_marks_old_mapping_stale(path):
+    writer = SnapshotWriter(path, capacity=64)
+    reader = SnapshotReader(path)
+    writer.publish({"n": 1})
+    assert reader.read()["n"] == 1
+
+    big = {"n": 2, "items": list(range(500))}
+    writer.publish(big)
+    assert writer.capacity > 64
+    # the reader still maps the old file; it must notice and reopen
+    snap = reader.read()
+    assert snap["version"] == 2
+    assert snap["items"] == big["items"]
+
+    writer.publish({"n": 3})
+    assert reader.read()["n"] == 3
+    writer.close()
+
+
+def _publish_loop(path, count):
+    writer = SnapshotWriter(path, capacity=256)
+    for i in range(1, count + 1):
+        # sizes vary so payloads straddle slot and file regrowth boundaries
+        writer.publish({"n": i, "items": [i] * (i % 97)})
+    writer.close()
+
+
+def test_reads_racing_publishes(path):
+    proc = mp.get_context("fork").Process(target=_publish_loop, args=(path, 3000))
+    proc.start()
+    reader = SnapshotReader(path)
+    seen = 0
+    last = 0
+    while proc.is_alive():
+        snap = reader.read()
+        if snap is None:
+            reader.close()  # the writer may not have created the file yet
+            continue
+        n = snap["n"]
+        # every decoded snapshot is internally consistent and never goes back
+        assert snap["items"] == [n] * (n % 97)
+        assert snap["version"] >= last
+        last = snap["version"]
+        seen += 1
+    proc.join()
+    assert proc.exitcode == 0
+    assert seen > 0
+    assert reader.read()["n"] == 3000
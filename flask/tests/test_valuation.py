@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+from valuation import PortfolioBook
+
+
+@pytest.fixture
+def book():
+    b = PortfolioBook(starting_cash=500.0)
+    b.update_prices({"A": 10.0})
+    b.apply_trade("u", "A", 5)
+    return b
+
+
+def test_update_prices_marks_holders(book):
+    assert book.update_prices({"A": 12.0, "B": 3.0}) == 1
+    assert book.value("u") == pytest.approx(510.0)
+    assert book.value("u") == pytest.approx(book.revalue("u"))
+
+
+@pytest.mark.parametrize("price", [None, math.nan, math.inf, 0, -1.0])
+def test_update_prices_skips_invalid(book, price):
+    book.update_prices({"A": price})
+    assert book.prices["A"] == 10.0
+    assert book.value("u") == pytest.approx(500.0)
+
+
+@pytest.mark.parametrize("shares", [0, math.nan, math.inf])
+def test_apply_trade_rejects_bad_shares(book, shares):
+    with pytest.raises(ValueError):
+        book.apply_trade("u", "A", shares)
+
+
+def test_close_day_overwrites_by_day(book):
+    for run in range(2):
+        for day in range(3):
+            book.update_prices({"A": 10.0 + day + run})
+            book.close_day(day)
+    book.close_day(-1)
+
+    days = [day for day, _ in book.equity_curve("u")]
+    assert days == [-1, 0, 1, 2]
+    assert book.equity_curve("u")[-1] == (2, pytest.approx(515.0))
@@ -0,0 +1,61 @@
+import multiprocessing as mp
+
+import pytest
+
+from sources import MetricRecord, SourceAdapter, ingest
+from yt_client import QuotaExceeded, QuotaTracker
+
+
+def test_quota_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    a = QuotaTracker(150, path)
+    b = QuotaTracker(150, path)
+
+    a.charge("search.list")
+    b.charge("channels.list")
+    assert a.used == b.used == 101
+    assert b.by_method() == {"search.list": 100, "channels.list": 1}
+    with pytest.raises(QuotaExceeded):
+        b.charge("search.list")
+    assert a.remaining() == 49
+
+
+def _charge_many(path, n):
+    tracker = QuotaTracker(10000, path)
+    for _ in range(n):
+        tracker.charge("channels.list")
+
+
+def test_quota_charges_from_many_processes_add_up(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    QuotaTracker(10000, path)
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=_charge_many, args=(path, 200)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    assert QuotaTracker(10000, path).used == 800
+
+
+class _QuotaAdapter(SourceAdapter):
+    platform = "fake"
+
+    def __init__(self, budget, **kwargs):
+        super().__init__(**kwargs)
+        self.tracker = QuotaTracker(budget)
+
+    def fetch(self, handle):
+        self.tracker.charge("channels.list")
+        return MetricRecord(self.platform, handle, handle)
+
+
+def test_ingest_stops_on_quota_exceeded():
+    adapter = _QuotaAdapter(5, max_concurrency=1)
+    written = []
+    with pytest.raises(QuotaExceeded):
+        ingest([(adapter, [f"h{i}" for i in range(50)])], written.extend, batch_size=2)
+    # what was fetched before the quota ran out is still flushed
+    assert [r.handle for r in written] == ["h0", "h1", "h2", "h3", "h4"]
+    assert adapter.tracker.used == 5
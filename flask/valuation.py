@@ -0,0 +1,176 @@
+"""Cached, incrementally marked-to-market portfolio valuations.
+
+`PortfolioBook` keeps every user's holdings, cash and current value in memory,
+plus an inverted index from channel to the users holding it. When a batch of
+prices arrives only the holders of channels whose price actually moved are
+touched, each by `shares * (new_price - old_price)`, so reading a portfolio's
+value is a dict lookup rather than a reprice of every holding.
+
+A compact daily equity curve is kept per user for charts and for the summary
+metrics from `simulator.summarize_portfolio`.
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from simulator import summarize_portfolio
+
+
+def _valid_price(price) -> bool:
+    return price is not None and math.isfinite(price) and price > 0
+
+
+class PortfolioBook:
+    """In-memory holdings and valuations for all users."""
+
+    def __init__(self, starting_cash: float = 500.0):
+        self.starting_cash = starting_cash
+        self.prices: Dict[Hashable, float] = {}
+        self.holdings: Dict[Hashable, Dict[Hashable, float]] = {}
+        self.cash: Dict[Hashable, float] = {}
+        self.holders: Dict[Hashable, set] = defaultdict(set)
+        self._values: Dict[Hashable, float] = {}
+        self._curve_days: Dict[Hashable, array] = {}
+        self._curve_values: Dict[Hashable, array] = {}
+        self._summaries: Dict[Hashable, Dict[str, float]] = {}
+        self._lock = threading.RLock()
+
+    def _ensure_user(self, user: Hashable):
+        if user not in self.holdings:
+            self.holdings[user] = {}
+            self.cash[user] = self.starting_cash
+            self._values[user] = self.starting_cash
+            self._curve_days[user] = array("l")
+            self._curve_values[user] = array("d")
+
+    # -----------------------------
+    # Writes
+    # -----------------------------
+    def apply_trade(
+        self, user: Hashable, channel: Hashable, shares: float, price: Optional[float] = None
+    ) -> float:
+        """Buy (positive `shares`) or sell (negative) a channel for a user.
+
+        Executes at `price`, defaulting to the channel's current price, and
+        returns the user's value afterwards. Raises ValueError if `shares` is
+        zero or not finite, there is no valid price, or the user lacks the cash
+        or shares for the trade.
+        """
+        if not math.isfinite(shares) or shares == 0:
+            raise ValueError("shares must be a finite, non-zero number")
+        with self._lock:
+            self._ensure_user(user)
+            if price is None:
+                price = self.prices.get(channel)
+            if not _valid_price(price):
+                raise ValueError(f"No valid price for channel {channel!r}")
+            self.prices.setdefault(channel, price)
+            held = self.holdings[user].get(channel, 0.0)
+            cost = shares * price
+            if held + shares < 0:
+                raise ValueError("Cannot sell more shares than held")
+            if cost > self.cash[user]:
+                raise ValueError("Insufficient cash")
+
+            self.cash[user] -= cost
+            new_held = held + shares
+            if new_held:
+                self.holdings[user][channel] = new_held
+                self.holders[channel].add(user)
+            else:
+                self.holdings[user].pop(channel, None)
+                self.holders[channel].discard(user)
+
+            # the trade moves cash into shares at `price`; value only changes by
+            # the gap between the execution price and the mark
+            self._values[user] += shares * (self.prices[channel] - price)
+            return self._values[user]
+
+    def update_prices(self, prices: Dict[Hashable, float]) -> int:
+        """Mark to market with a batch of new prices.
+
+        Only channels whose price changed are revalued, and only for the users
+        holding them. Missing, non-finite or non-positive prices are skipped,
+        keeping the channel's last good price. Returns the number of
+        (user, channel) positions touched.
+        """
+        touched = 0
+        with self._lock:
+            for channel, price in prices.items():
+                if not _valid_price(price):
+                    continue
+                old = self.prices.get(channel)
+                self.prices[channel] = price
+                if old is None or old == price:
+                    continue
+                delta = price - old
+                for user in self.holders.get(channel, ()):
+                    self._values[user] += self.holdings[user][channel] * delta
+                    touched += 1
+        return touched
+
+    def close_day(self, day: int):
+        """Record each user's current value on their equity curve for `day`.
+
+        The curve stays ordered by day: closing a day that is already on it
+        (e.g. when historical data is regenerated) overwrites that day.
+        """
+        with self._lock:
+            for user, value in self._values.items():
+                days = self._curve_days[user]
+                values = self._curve_values[user]
+                i = bisect_left(days, day)
+                if i < len(days) and days[i] == day:
+                    values[i] = value
+                else:
+                    days.insert(i, day)
+                    values.insert(i, value)
+            self._summaries.clear()
+
+    def revalue(self, user: Hashable) -> float:
+        """Recompute a user's value from scratch, correcting any float drift."""
+        with self._lock:
+            self._ensure_user(user)
+            value = self.cash[user] + sum(
+                shares * self.prices.get(channel, 0.0)
+                for channel, shares in self.holdings[user].items()
+            )
+            self._values[user] = value
+            return value
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    def value(self, user: Hashable) -> float:
+        """Current marked-to-market value (cash + holdings) of a user."""
+        return self._values.get(user, self.starting_cash)
+
+    def equity_curve(self, user: Hashable) -> List[Tuple[int, float]]:
+        """(day, value) pairs recorded by `close_day`."""
+        with self._lock:
+            return list(
+                zip(self._curve_days.get(user, ()), self._curve_values.get(user, ()))
+            )
+
+    def summary(self, user: Hashable) -> Dict[str, float]:
+        """`summarize_portfolio` over the user's equity curve, cached per day close."""
+        with self._lock:
+            cached = self._summaries.get(user)
+            if cached is None:
+                cached = summarize_portfolio(list(self._curve_values.get(user, ())))
+                self._summaries[user] = cached
+            return cached
+
+    def snapshot(self, user: Hashable) -> Dict:
+        """Everything the portfolio page needs for one user."""
+        with self._lock:
+            return {
+                "value": self.value(user),
+                "cash": self.cash.get(user, self.starting_cash),
+                "holdings": dict(self.holdings.get(user, {})),
+                "equity_curve": self.equity_curve(user),
+                "summary": self.summary(user),
+            }
@@ -0,0 +1,302 @@
+"""Shared YouTube Data API client used by every module that talks to YouTube.
+
+All calls go through one `YouTubeClient` (see `get_client`), which adds:
+
+- a token-bucket rate limit across all threads
+- daily quota accounting using the per-method unit costs from the API docs
+  (search.list is 100 units, channels.list is 1); calls that would overrun
+  the budget raise `QuotaExceeded` instead of being sent
+- single-flight coalescing: concurrent identical calls share one request
+- an on-disk response cache; fresh entries are served without a request and
+  stale ones are revalidated with their ETag (a 304 keeps the cached body)
+- replay mode, which serves only recorded responses and never touches the
+  network, for offline tests and benchmarks
+
+Configured from the environment: YOUTUBE_API_KEY, YT_CACHE_DIR,
+YT_CACHE_TTL (seconds), YT_RATE (requests/second), YT_DAILY_QUOTA and
+YT_REPLAY=1.
+"""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from ratelimit import RateBudget
+
+# Quota cost in units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COSTS = {
+    "channels.list": 1,
+    "search.list": 100,
+    "videos.list": 1,
+    "playlistItems.list": 1,
+}
+DEFAULT_DAILY_QUOTA = 10000
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "instance", "yt_cache"
+)
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call would exceed the remaining daily quota."""
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode when no recorded response exists for a call."""
+
+
+class QuotaTracker:
+    """Counts quota units spent today in a small SQLite file.
+
+    Every charge is a read-modify-write inside one IMMEDIATE transaction, so
+    all processes sharing the file (app, job workers, the serve.py writer)
+    draw from the same daily budget. Without a path the count is in memory.
+    Days roll over at midnight US Pacific time, like the API's own quota.
+    """
+
+    def __init__(self, daily_limit: int, path: Optional[str] = None):
+        self.daily_limit = daily_limit
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path or ":memory:", timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            " day TEXT NOT NULL, method TEXT NOT NULL, units INTEGER NOT NULL,"
+            " PRIMARY KEY (day, method))"
+        )
+
+    @staticmethod
+    def _today() -> str:
+        # fixed UTC-8 offset; close enough to Pacific for budgeting purposes
+        now = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=-8)))
+        return now.date().isoformat()
+
+    def _used(self, day: str) -> int:
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(units), 0) FROM quota WHERE day = ?", (day,)
+        ).fetchone()
+        return row[0]
+
+    def charge(self, method: str):
+        """Reserve the cost of `method`, raising QuotaExceeded if it won't fit."""
+        cost = QUOTA_COSTS.get(method, 1)
+        day = self._today()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                used = self._used(day)
+                if used + cost > self.daily_limit:
+                    raise QuotaExceeded(
+                        f"{method} needs {cost} units, "
+                        f"{self.daily_limit - used} of {self.daily_limit} left today"
+                    )
+                self._conn.execute(
+                    "INSERT INTO quota (day, method, units) VALUES (?, ?, ?)"
+                    " ON CONFLICT (day, method) DO UPDATE SET units = units + ?",
+                    (day, method, cost, cost),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @property
+    def used(self) -> int:
+        """Units spent today across every process sharing the file."""
+        with self._lock:
+            return self._used(self._today())
+
+    def by_method(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT method, units FROM quota WHERE day = ?", (self._today(),)
+            ).fetchall()
+        return dict(rows)
+
+    def remaining(self) -> int:
+        return self.daily_limit - self.used
+
+
+class YouTubeClient:
+    """Rate-limited, quota-aware, caching wrapper around the YouTube Data API v3."""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        ttl: float = 3600,
+        rate_per_sec: float = 5,
+        daily_quota: int = DEFAULT_DAILY_QUOTA,
+        replay: bool = False,
+    ):
+        self.api_key = api_key
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.replay = replay
+        self.budget = RateBudget(rate_per_sec)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.quota = QuotaTracker(
+            daily_quota, os.path.join(cache_dir, "quota.sqlite3") if cache_dir else None
+        )
+        self.stats = {"requests": 0, "cache_hits": 0, "revalidated": 0, "coalesced": 0}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def channels_list(self, max_age: Optional[float] = None, **params) -> Dict:
+        return self.call("channels", "list", max_age=max_age, **params)
+
+    def search_list(self, max_age: Optional[float] = None, **params) -> Dict:
+        return self.call("search", "list", max_age=max_age, **params)
+
+    def call(
+        self, resource: str, method: str, max_age: Optional[float] = None, **params
+    ) -> Dict:
+        """Execute `youtube.<resource>().<method>(**params)` and return the response.
+
+        Cached responses younger than `max_age` seconds (default: the client's
+        ttl) are returned without a request. Identical concurrent calls are
+        coalesced into a single request.
+        """
+        key = self._key(resource, method, params)
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return fut.result()
+
+        try:
+            result = self._call_uncoalesced(
+                key, resource, method, params, self.ttl if max_age is None else max_age
+            )
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # -----------------------------
+    # Internals
+    # -----------------------------
+    @staticmethod
+    def _key(resource: str, method: str, params: Dict) -> str:
+        raw = json.dumps([resource, method, params], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _cache_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, f"{key}.json") if self.cache_dir else None
+
+    def _load_cached(self, key: str) -> Optional[Dict]:
+        path = self._cache_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, entry: Dict):
+        path = self._cache_path(key)
+        if not path:
+            return
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def _service(self):
+        # googleapiclient services are not thread-safe; keep one per thread
+        if getattr(self._local, "youtube", None) is None:
+            import googleapiclient.discovery
+
+            self._local.youtube = googleapiclient.discovery.build(
+                "youtube", "v3", developerKey=self.api_key
+            )
+        return self._local.youtube
+
+    def _call_uncoalesced(
+        self, key: str, resource: str, method: str, params: Dict, max_age: float
+    ) -> Dict:
+        cached = self._load_cached(key)
+        if self.replay:
+            if cached is None:
+                raise ReplayMiss(f"No recorded response for {resource}.{method} {params}")
+            self.stats["cache_hits"] += 1
+            return cached["response"]
+        if cached is not None and time.time() - cached["fetched_at"] < max_age:
+            self.stats["cache_hits"] += 1
+            return cached["response"]
+
+        if not self.api_key:
+            raise RuntimeError("No YOUTUBE_API_KEY configured")
+        self.quota.charge(f"{resource}.{method}")
+        self.budget.acquire()
+
+        req = getattr(self._service(), resource)()
+        req = getattr(req, method)(**params)
+        if cached is not None and cached.get("etag"):
+            req.headers["If-None-Match"] = cached["etag"]
+        self.stats["requests"] += 1
+        try:
+            response = req.execute()
+        except Exception as e:
+            # googleapiclient raises HttpError for a 304 Not Modified
+            status = getattr(getattr(e, "resp", None), "status", None)
+            if cached is not None and status == 304:
+                self.stats["revalidated"] += 1
+                cached["fetched_at"] = time.time()
+                self._store(key, cached)
+                return cached["response"]
+            raise
+
+        self._store(
+            key,
+            {
+                "resource": resource,
+                "method": method,
+                "params": params,
+                "etag": response.get("etag"),
+                "fetched_at": time.time(),
+                "response": response,
+            },
+        )
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> YouTubeClient:
+    """The process-wide client, built from environment settings on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = YouTubeClient(
+                api_key=os.getenv("YOUTUBE_API_KEY"),
+                cache_dir=os.getenv("YT_CACHE_DIR", DEFAULT_CACHE_DIR),
+                ttl=float(os.getenv("YT_CACHE_TTL", "3600")),
+                rate_per_sec=float(os.getenv("YT_RATE", "5")),
+                daily_quota=int(os.getenv("YT_DAILY_QUOTA", str(DEFAULT_DAILY_QUOTA))),
+                replay=os.getenv("YT_REPLAY", "").lower() in ("1", "true", "yes"),
+            )
+        return _client